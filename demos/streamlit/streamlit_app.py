@@ -1,14 +1,34 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-import anthropic
-import plotly.express as px
+import threading
+import time
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from io import StringIO
-import tempfile
-import os
+from collections import OrderedDict
+from io import BytesIO
+import hashlib
+import logging
+import re
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+try:
+    import duckdb
+except ImportError:  # fall back to SQLite execution
+    duckdb = None
+
+try:
+    import python_calamine  # noqa: F401 - backs pandas' "calamine" Excel engine
+    EXCEL_ENGINE = "calamine"
+except ImportError:  # fall back to pandas' default (openpyxl)
+    EXCEL_ENGINE = None
+
+logger = logging.getLogger(__name__)
+
+# SQL dialect of the execution engine, so generated queries match it
+SQL_DIALECT = "DuckDB" if duckdb is not None else "SQLite"
 
 # Page config
 st.set_page_config(
@@ -18,8 +38,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for professional look
-st.markdown("""
+# Custom CSS for professional look. Emitted on every run: Streamlit removes
+# elements a rerun doesn't re-send, so skipping it would drop the styling.
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 3.5rem;
@@ -71,6 +92,13 @@ st.markdown("""
         border-left: 5px solid #667eea;
         margin: 1rem 0;
     }
+    .feature-row {
+        display: flex;
+        gap: 1rem;
+    }
+    .feature-row .feature-box {
+        flex: 1;
+    }
     .insight-box {
         background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
         color: white;
@@ -81,7 +109,76 @@ st.markdown("""
         line-height: 1.6;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
+# Static HTML blocks, built once at import instead of on every rerun
+COMPETITIVE_ADVANTAGE_HTML = (
+    """
+<div class="competitive-advantage">
+<h4>Privacy First</h4>
+<p>No database credentials needed. Your data never leaves this session.</p>
+</div>
+""",
+    """
+<div class="competitive-advantage">
+<h4>Execute & Visualize</h4>
+<p>Run SQL on your data and get instant charts. No copy-paste needed.</p>
+</div>
+""",
+    """
+<div class="competitive-advantage">
+<h4>Smart Learning</h4>
+<p>Remembers your data patterns for better query suggestions.</p>
+</div>
+""",
+)
+
+AI_REPORT_HEADER_HTML = """
+<div class="insight-box">
+<h2 style="color: white; margin: 0;"> AI Business Intelligence Report</h2>
+<p style="color: white; margin: 5px 0; font-size: 1.1rem;">Executive-Level Strategic Analysis</p>
+</div>
+"""
+
+VALUE_PROP_HTML = """
+<div class="metric-card">
+<h3 style="color: #667eea; margin-top: 0;"> SQL Genius AI Business Value</h3>
+<p style="font-size: 1.1rem; margin: 10px 0;">
+<strong> Replaces $100K+ Data Analyst</strong><br>
+ Instant executive-level insights<br>
+ Strategic recommendations with ROI estimates<br>
+ Professional-grade business intelligence<br>
+ Zero setup time - immediate results
+</p>
+<p style="color: #764ba2; font-weight: bold; font-size: 1.2rem;">
+ Typical customer saves 20-40 hours/month on data analysis
+</p>
+</div>
+"""
+
+LANDING_HTML = """
+##  How It Works
+
+<div class="feature-row">
+<div class="feature-box">
+<h3>1.  Upload Data</h3>
+<p>Drag & drop your CSV or Excel file. Your data stays completely private.</p>
+</div>
+<div class="feature-box">
+<h3>2.  Ask Questions</h3>
+<p>Describe what you want to know in plain English. No SQL knowledge required.</p>
+</div>
+<div class="feature-box">
+<h3>3.  Get Insights</h3>
+<p>See results, charts, and explanations instantly. Download everything.</p>
+</div>
+</div>
+
+---
+
+###  Upload your data file to get started!
+"""
 
 def check_usage_limit():
     """Simple usage limiting - 3 free queries per session"""
@@ -142,495 +239,839 @@ def init_anthropic():
         st.error(f"Error reading secrets: {str(e)}")
         return False
 
-def generate_sql_query(natural_language, schema_info, data_preview):
-    """Generate SQL query using Claude"""
-    try:
-        client = anthropic.Anthropic(api_key=st.secrets.general.claude_api_key)
-        
-        prompt = f"""You are an expert SQL analyst. Generate an optimized SQL query based on this request:
-
-User Request: {natural_language}
-
-Database Schema: {schema_info}
-
-Sample Data Preview: {data_preview}
+# Static instructions for SQL generation. Kept byte-identical across calls so
+# the system prefix stays eligible for Anthropic prompt caching.
+SQL_SYSTEM_PROMPT = f"""You are an expert SQL analyst. Generate an optimized SQL query for the user's request against the database described below.
 
 Requirements:
 1. Generate ONLY the SQL query (no explanations)
-2. Use SQLite syntax
+2. Use {SQL_DIALECT} syntax
 3. Optimize for performance
 4. Include comments for complex logic
 5. Use appropriate JOINs and WHERE clauses
 6. Table name is always "data"
+"""
 
-SQL Query:"""
-        
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=500,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        # Extract just the SQL from Claude's response
-        sql_response = message.content[0].text.strip()
-        
-        # Clean up any markdown formatting
-        if "```sql" in sql_response:
-            sql_response = sql_response.split("```sql")[1].split("```")[0].strip()
-        elif "```" in sql_response:
-            sql_response = sql_response.split("```")[1].strip()
-            
-        return sql_response
+# Short, templated SQL completions don't need Sonnet; set general.claude_model
+# in secrets to override
+DEFAULT_SQL_MODEL = "claude-3-5-haiku-20241022"
+
+def stream_sql_query(natural_language, schema_info, data_preview):
+    """Stream Claude's raw SQL response as text deltas (API errors propagate to the caller)"""
+    # Imported on first use: the SDK takes about a second to import, which the
+    # landing page shouldn't wait for
+    import anthropic
+    
+    client = anthropic.Anthropic(api_key=st.secrets.general.claude_api_key)
+    
+    # Instructions + schema/preview form a stable prefix marked for prompt
+    # caching; only the user's question varies between calls on one upload.
+    # The 1h TTL outlasts analyst think-time between questions (the default
+    # 5 minutes often doesn't), at a higher one-off write cost.
+    with client.messages.stream(
+        model=st.secrets.general.get("claude_model", DEFAULT_SQL_MODEL),
+        max_tokens=500,
+        system=[
+            {"type": "text", "text": SQL_SYSTEM_PROMPT},
+            {
+                "type": "text",
+                "text": f"Database Schema: {schema_info}\n\nSample Data Preview: {data_preview}",
+                "cache_control": {"type": "ephemeral", "ttl": "1h"}
+            }
+        ],
+        messages=[{"role": "user", "content": f"User Request: {natural_language}\n\nSQL Query:"}]
+    ) as stream:
+        yield from stream.text_stream
+        usage = stream.get_final_message().usage
+    
+    # Prefixes under the model's minimum cacheable length are never cached, so
+    # cache_read stays 0 for small schemas; this shows whether hits happen
+    logger.info(
+        "SQL generation tokens: input=%s cache_read=%s cache_write=%s output=%s",
+        usage.input_tokens, usage.cache_read_input_tokens,
+        usage.cache_creation_input_tokens, usage.output_tokens
+    )
+
+def clean_sql_response(sql_response):
+    """Extract just the SQL from Claude's response"""
+    sql_response = sql_response.strip()
+    
+    # Clean up any markdown formatting
+    if "```sql" in sql_response:
+        sql_response = sql_response.split("```sql")[1].split("```")[0].strip()
+    elif "```" in sql_response:
+        sql_response = sql_response.split("```")[1].strip()
         
-    except Exception as e:
-        st.error(f"Error generating SQL: {str(e)}")
-        return None
+    return sql_response
 
-def execute_sql_on_dataframe(df, sql_query, table_name="data"):
-    """Execute SQL query on pandas DataFrame using SQLite"""
+def generate_sql_query(natural_language, schema_info, data_preview):
+    """Generate SQL query using Claude, showing the response while it streams in"""
+    # The placeholder is cleared once the response is complete; the caller
+    # shows the final SQL
+    placeholder = st.empty()
+    sql_response = ""
     try:
-        # Create temporary SQLite database
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as tmp_file:
-            conn = sqlite3.connect(tmp_file.name)
-            
-            # Load DataFrame into SQLite
-            df.to_sql(table_name, conn, if_exists='replace', index=False)
-            
-            # Execute query
-            result_df = pd.read_sql_query(sql_query, conn)
-            conn.close()
-            
-            # Clean up temp file
-            os.unlink(tmp_file.name)
+        # Redraw as a highlighted SQL block (fences stripped) on every delta
+        for chunk in stream_sql_query(natural_language, schema_info, data_preview):
+            sql_response += chunk
+            placeholder.code(clean_sql_response(sql_response), language="sql")
+    finally:
+        placeholder.empty()
+    
+    return clean_sql_response(sql_response)
+
+# Speed-over-safety settings for the ephemeral SQLite fallback database
+SQLITE_PRAGMAS = """
+PRAGMA journal_mode=OFF;
+PRAGMA synchronous=OFF;
+PRAGMA temp_store=MEMORY;
+PRAGMA locking_mode=EXCLUSIVE;
+PRAGMA cache_size=-65536;
+"""
+
+# Generated SQL comes from free user text: no file reads/writes, ATTACH or
+# extension loading (registered DataFrames are still readable)
+DUCKDB_CONFIG = {'enable_external_access': False}
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def duckdb_connection(df_key, _df, table_name="data"):
+    """In-memory DuckDB copy of one upload, loaded once and shared by every query on it"""
+    conn = duckdb.connect(config=DUCKDB_CONFIG)
+    # Native columnar storage plans and scans faster than a registered DataFrame
+    conn.register("upload", _df)
+    conn.execute(f'CREATE TABLE "{table_name}" AS SELECT * FROM upload')
+    conn.unregister("upload")
+    # Generated SQL must not be able to SET its way back out of the sandbox
+    conn.execute("SET lock_configuration = true")
+    return conn
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def sqlite_connection(df_key, _df, table_name="data"):
+    """In-memory SQLite copy of one upload, loaded once and shared by every query on it"""
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.executescript(SQLITE_PRAGMAS)
+    _df.to_sql(table_name, conn, index=False, chunksize=10000)
+    # Generated SQL must not be able to modify the shared copy
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+def execute_sql_on_dataframe(df, sql_query, df_key, table_name="data"):
+    """Execute SQL query on pandas DataFrame using DuckDB (SQLite if DuckDB is missing)"""
+    try:
+        if duckdb is not None:
+            # The loaded copy is shared by every session on these bytes, and a
+            # transaction can't guard it (generated SQL may COMMIT itself), so
+            # anything but a single SELECT is refused before it runs
+            statements = duckdb.extract_statements(sql_query)
+            if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+                raise ValueError("Only a single SELECT query can be run on your data")
             
-            return result_df
+            # Query the upload's loaded copy through a per-query cursor
+            # (cursors are thread-safe)
+            with duckdb_connection(df_key, df, table_name).cursor() as cursor:
+                return cursor.execute(sql_query).df()
+        
+        # Reuse the upload's loaded SQLite copy, so a query is a pure SELECT
+        return pd.read_sql_query(sql_query, sqlite_connection(df_key, df, table_name))
     except Exception as e:
         st.error(f"Error executing SQL: {str(e)}")
         return None
 
+# pandas' default na_values: blank cells and these markers load as missing, not
+# as text, so SQL IS NULL filters and groupings see them as NULL
+CSV_NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+CSV_CONVERT_OPTIONS = pa_csv.ConvertOptions(null_values=CSV_NULL_VALUES, strings_can_be_null=True)
+# Quoted cells may span lines; without this, files larger than one parse block fail
+CSV_PARSE_OPTIONS = pa_csv.ParseOptions(newlines_in_values=True)
 
+# Text columns with fewer distinct values than this share of rows become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
 
-def create_visualizations(df, query_type="auto"):
-    """Create modern business intelligence visualizations with professional styling"""
-    charts = []
-    
-    if df.empty:
-        return charts
-    
-    # Detect numeric and categorical columns
-    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
-    
-    # Remove any ID-like columns from numeric analysis
-    numeric_cols = [col for col in numeric_cols if not any(x in col.lower() for x in ['id', 'index', 'rank'])]
-    
-    if len(numeric_cols) == 0:
-        return charts
-    
-    # MODERN COLOR PALETTE
-    MODERN_COLORS = {
-        'primary': ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd'],
-        'gradient': ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe'],
-        'performance': ['#e74c3c', '#f39c12', '#f1c40f', '#2ecc71', '#27ae60'],
-        'background': 'rgba(248,249,250,0.95)',
-        'text': '#2c3e50'
-    }
-    
-    # STANDARDIZED FORMATTING FUNCTION
-    def apply_modern_formatting(fig, title, height=550):
-        """Apply modern, professional formatting to all charts"""
-        fig.update_layout(
-            title={
-                'text': f"<b style='font-size:20px'>{title}</b>",
-                'x': 0.5,
-                'xanchor': 'center',
-                'font': {'size': 20, 'family': 'Inter, Arial', 'color': MODERN_COLORS['text']},
-                'pad': {'t': 20, 'b': 20}
-            },
-            height=height,
-            paper_bgcolor=MODERN_COLORS['background'],
-            plot_bgcolor='rgba(255,255,255,0.98)',
-            font=dict(family="Inter, Arial", size=13, color=MODERN_COLORS['text']),
-            margin=dict(l=80, r=80, t=100, b=80),
-            showlegend=True,
-            hovermode='closest'
-        )
-        
-        # Modern grid styling
-        fig.update_xaxes(
-            gridcolor='rgba(200,200,200,0.2)',
-            gridwidth=1,
-            zeroline=False,
-            showline=True,
-            linecolor='rgba(200,200,200,0.5)'
-        )
-        fig.update_yaxes(
-            gridcolor='rgba(200,200,200,0.2)', 
-            gridwidth=1,
-            zeroline=False,
-            showline=True,
-            linecolor='rgba(200,200,200,0.5)'
-        )
-        
-        return fig
-    
-    # 1. MODERN KPI DASHBOARD - METRIC CARDS STYLE
-    if len(numeric_cols) >= 1:
-        # Create subplot grid for modern metric cards
-        rows = 2 if len(numeric_cols) > 3 else 1
-        cols = min(3, len(numeric_cols))
-        
-        fig_kpi = make_subplots(
-            rows=rows, 
-            cols=cols,
-            subplot_titles=[col.replace('_', ' ').title() for col in numeric_cols[:6]],
-            specs=[[{'type': 'indicator'}] * cols for _ in range(rows)],
-            vertical_spacing=0.3,
-            horizontal_spacing=0.15
-        )
-        
-        # Add modern gauge/indicator charts
-        for i, col in enumerate(numeric_cols[:6]):
-            row = (i // cols) + 1
-            col_pos = (i % cols) + 1
-            
-            total_val = df[col].sum()
-            avg_val = df[col].mean()
-            max_val = df[col].max()
-            
-            # Calculate performance percentage (relative to max)
-            performance_pct = (avg_val / max_val * 100) if max_val > 0 else 0
-            
-            # Determine color based on performance
-            if performance_pct >= 75:
-                color = MODERN_COLORS['performance'][4]  # Green
-            elif performance_pct >= 50:
-                color = MODERN_COLORS['performance'][3]  # Light green
-            elif performance_pct >= 25:
-                color = MODERN_COLORS['performance'][1]  # Orange
-            else:
-                color = MODERN_COLORS['performance'][0]  # Red
-            
-            # Format value based on column type
-            if 'spend' in col.lower() or 'cost' in col.lower() or 'revenue' in col.lower():
-                value_text = f"${total_val:,.0f}"
-                reference_text = f"Avg: ${avg_val:,.0f}"
-            else:
-                value_text = f"{total_val:,.0f}"
-                reference_text = f"Avg: {avg_val:,.0f}"
-            
-            fig_kpi.add_trace(
-                go.Indicator(
-                    mode="number+gauge+delta",
-                    value=total_val,
-                    delta={'reference': avg_val * len(df), 'relative': True, 'valueformat': '.1%'},
-                    gauge={
-                        'axis': {'range': [0, max_val * len(df)]},
-                        'bar': {'color': color, 'thickness': 0.8},
-                        'bgcolor': "rgba(255,255,255,0.8)",
-                        'borderwidth': 2,
-                        'bordercolor': color,
-                        'steps': [
-                            {'range': [0, max_val * len(df) * 0.5], 'color': "rgba(200,200,200,0.2)"},
-                            {'range': [max_val * len(df) * 0.5, max_val * len(df) * 0.8], 'color': "rgba(255,193,7,0.3)"},
-                            {'range': [max_val * len(df) * 0.8, max_val * len(df)], 'color': "rgba(40,167,69,0.3)"}
-                        ],
-                        'threshold': {
-                            'line': {'color': MODERN_COLORS['text'], 'width': 3},
-                            'thickness': 0.8,
-                            'value': avg_val * len(df)
-                        }
-                    },
-                    number={'font': {'size': 24, 'family': 'Inter, Arial'}},
-                    title={'text': f"<br><span style='font-size:12px'>{reference_text}</span>"}
-                ),
-                row=row, col=col_pos
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_dataframe(df_key, file_name, _raw):
+    """Parse an uploaded CSV/Excel file once per upload and compact its dtypes"""
+    if file_name.endswith('.csv'):
+        # pyarrow (a Streamlit dependency) parses CSV multithreaded in C++; one
+        # block per column and self_destruct hand the columns to pandas without
+        # a consolidation copy, freeing Arrow buffers as they are converted
+        try:
+            table = pa_csv.read_csv(
+                BytesIO(_raw), parse_options=CSV_PARSE_OPTIONS, convert_options=CSV_CONVERT_OPTIONS
             )
-        
-        fig_kpi.update_layout(
-            title={
-                'text': "<b style='font-size:24px'>Executive Performance Dashboard</b>",
-                'x': 0.5,
-                'xanchor': 'center',
-                'font': {'size': 24, 'family': 'Inter, Arial', 'color': MODERN_COLORS['text']}
-            },
-            height=450 if rows == 1 else 700,
-            paper_bgcolor=MODERN_COLORS['background'],
-            font=dict(family="Inter, Arial", size=12),
-            margin=dict(l=60, r=60, t=120, b=60)
-        )
-        
-        charts.append(("Executive Performance Dashboard", fig_kpi))
-    
-    # 2. ENHANCED CORRELATION ANALYSIS
-    if len(numeric_cols) >= 2:
-        correlation_data = df[numeric_cols].corr()
-        
-        # Create modern correlation heatmap
-        fig_corr = go.Figure(data=go.Heatmap(
-            z=correlation_data.values,
-            x=correlation_data.columns,
-            y=correlation_data.columns,
-            colorscale='RdBu_r',
-            zmid=0,
-            zmin=-1,
-            zmax=1,
-            text=correlation_data.round(2).values,
-            texttemplate="%{text}",
-            textfont={"size": 14, "color": "white"},
-            hoverongaps=False,
-            hovertemplate='<b>%{y} vs %{x}</b><br>Correlation: %{z:.3f}<extra></extra>'
-        ))
-        
-        # Add correlation strength annotations
-        for i in range(len(correlation_data.columns)):
-            for j in range(len(correlation_data.columns)):
-                if i != j:
-                    corr_val = correlation_data.iloc[i, j]
-                    if abs(corr_val) >= 0.7:
-                        strength = "Strong"
-                        color = "white"
-                    elif abs(corr_val) >= 0.3:
-                        strength = "Moderate" 
-                        color = "black"
-                    else:
-                        strength = "Weak"
-                        color = "gray"
-                    
-                    fig_corr.add_annotation(
-                        x=j, y=i,
-                        text=f"<b>{strength}</b>",
-                        showarrow=False,
-                        font=dict(color=color, size=10),
-                        yshift=15
-                    )
-        
-        fig_corr = apply_modern_formatting(fig_corr, "Performance Correlation Matrix", 550)
-        charts.append(("Correlation Analysis", fig_corr))
+            df = table.to_pandas(split_blocks=True, self_destruct=True)
+        except pa.ArrowInvalid:
+            # pyarrow rejects files pandas tolerates (e.g. short rows, which
+            # pandas pads with NaN), so those still load through pandas' parser
+            df = pd.read_csv(BytesIO(_raw))
+    else:
+        # calamine (Rust) parses workbooks several times faster than openpyxl
+        df = pd.read_excel(BytesIO(_raw), engine=EXCEL_ENGINE)
     
-    # 3. MODERN ROI ANALYSIS WITH STRATEGIC ZONES
-    if len(numeric_cols) >= 2:
-        primary_metric = numeric_cols[0]
-        secondary_metric = numeric_cols[1] if len(numeric_cols) > 1 else numeric_cols[0]
-        
-        # Calculate ROI ratio
-        df_roi = df.copy()
-        df_roi['roi_ratio'] = df_roi[primary_metric] / df_roi[secondary_metric].replace(0, 1)
-        
-        # Create strategic zones histogram
-        fig_roi = go.Figure()
-        
-        # Add histogram
-        fig_roi.add_trace(go.Histogram(
-            x=df_roi['roi_ratio'],
-            nbinsx=20,
-            name='ROI Distribution',
-            marker=dict(
-                color=MODERN_COLORS['gradient'][0],
-                opacity=0.8,
-                line=dict(color='white', width=1)
-            ),
-            hovertemplate='ROI Range: %{x}<br>Count: %{y}<extra></extra>'
-        ))
-        
-        # Calculate strategic zones
-        roi_25th = df_roi['roi_ratio'].quantile(0.25)
-        roi_50th = df_roi['roi_ratio'].quantile(0.50)
-        roi_75th = df_roi['roi_ratio'].quantile(0.75)
-        roi_90th = df_roi['roi_ratio'].quantile(0.90)
-        
-        # Add strategic zone backgrounds
-        fig_roi.add_vrect(
-            x0=df_roi['roi_ratio'].min(), x1=roi_25th,
-            fillcolor="rgba(231,76,60,0.2)", line_width=0,
-            annotation_text="Needs Attention", annotation_position="top left"
-        )
-        fig_roi.add_vrect(
-            x0=roi_25th, x1=roi_75th,
-            fillcolor="rgba(241,196,15,0.2)", line_width=0,
-            annotation_text="Average Performance", annotation_position="top"
-        )
-        fig_roi.add_vrect(
-            x0=roi_75th, x1=roi_90th,
-            fillcolor="rgba(46,204,113,0.2)", line_width=0,
-            annotation_text="Good Performance", annotation_position="top"
-        )
-        fig_roi.add_vrect(
-            x0=roi_90th, x1=df_roi['roi_ratio'].max(),
-            fillcolor="rgba(39,174,96,0.3)", line_width=0,
-            annotation_text="Excellent", annotation_position="top right"
-        )
-        
-        # Add benchmark lines
-        fig_roi.add_vline(
-            x=roi_50th, line_dash="solid", line_color="#e74c3c", line_width=3,
-            annotation_text=f"Median: {roi_50th:.2f}", annotation_position="top"
-        )
-        fig_roi.add_vline(
-            x=roi_75th, line_dash="dash", line_color="#27ae60", line_width=2,
-            annotation_text=f"Top 25%: {roi_75th:.2f}", annotation_position="bottom right"
-        )
-        
-        fig_roi = apply_modern_formatting(
-            fig_roi, 
-            f"ROI Strategic Analysis: {primary_metric.replace('_', ' ').title()}/{secondary_metric.replace('_', ' ').title()}"
-        )
-        fig_roi.update_layout(showlegend=False)
-        
-        charts.append(("ROI Strategic Analysis", fig_roi))
+    # pandas 3 keeps text Arrow-backed (str dtype); low-cardinality text goes
+    # further to category codes, so grouping and hashing scan small integers.
+    # Object columns (CSV dates, nullable booleans, mixed cells) are left alone:
+    # DuckDB can't scan a categorical whose categories are Python objects
+    if len(df) > 0:
+        for col in df.select_dtypes(include=['string']).columns:
+            if df[col].nunique() / len(df) < CATEGORY_MAX_UNIQUE_RATIO:
+                df[col] = df[col].astype('category')
     
-    # 4. ENHANCED PERFORMANCE COMPARISON
-    if len(categorical_cols) > 0 and len(numeric_cols) > 0:
-        cat_col = categorical_cols[0]
-        comparison_data = df.groupby(cat_col)[numeric_cols[0]].agg(['mean', 'sum', 'count']).reset_index()
-        comparison_data.columns = [cat_col, 'average', 'total', 'count']
-        
-        # Create modern bar chart with gradient colors
-        fig_comparison = go.Figure()
-        
-        # Sort by average for better visualization
-        comparison_data = comparison_data.sort_values('average', ascending=True)
-        
-        # Add bars with gradient coloring
-        fig_comparison.add_trace(go.Bar(
-            x=comparison_data[cat_col],
-            y=comparison_data['average'],
-            name='Average Performance',
-            marker=dict(
-                color=comparison_data['average'],
-                colorscale='Viridis',
-                colorbar=dict(title="Performance Level"),
-                line=dict(color='white', width=2)
-            ),
-            text=comparison_data['average'].apply(lambda x: f"{x:,.0f}"),
-            textposition='outside',
-            textfont=dict(size=12, family='Inter, Arial'),
-            hovertemplate='<b>%{x}</b><br>Average: %{y:,.0f}<br>Total: %{customdata:,.0f}<extra></extra>',
-            customdata=comparison_data['total']
-        ))
-        
-        # Add overall average line with better styling
-        overall_avg = df[numeric_cols[0]].mean()
-        fig_comparison.add_hline(
-            y=overall_avg,
-            line_dash="dash",
-            line_color="#e74c3c",
-            line_width=3,
-            annotation_text=f"Overall Average: {overall_avg:,.0f}",
-            annotation_position="top right",
-            annotation=dict(
-                bgcolor="rgba(231,76,60,0.8)",
-                bordercolor="white",
-                font=dict(color="white", size=12)
-            )
-        )
-        
-        fig_comparison = apply_modern_formatting(
-            fig_comparison, 
-            f"Performance Comparison by {cat_col.replace('_', ' ').title()}"
-        )
-        fig_comparison.update_layout(
-            xaxis=dict(tickangle=45, categoryorder='total ascending'),
-            showlegend=False
-        )
-        
-        charts.append(("Performance Benchmarking", fig_comparison))
+    # Numbers stay 64-bit. DuckDB doesn't widen integer arithmetic, so generated
+    # SQL like spend * employees would overflow narrower ints; float32 turns
+    # 3.2 into 3.2000000477, which leaks into results and breaks = filters
+    return df
+
+def split_columns(df):
+    """Numeric and text/categorical column names from a single pass over the dtypes"""
+    numeric_cols, text_cols = [], []
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            numeric_cols.append(col)
+        elif pd.api.types.is_string_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+            text_cols.append(col)
+    return numeric_cols, text_cols
+
+# Example analyses offered above the question box: label -> builder that takes
+# the upload's (numeric_cols, text_cols) and returns the prompt, or None when
+# the upload lacks the columns the example needs
+EXAMPLE_QUERIES = {
+    "Performance Analysis: Top Performers by Revenue": lambda numeric_cols, text_cols: (
+        f"Show me the top 10 records ordered by {numeric_cols[0]} in descending order"
+        if numeric_cols else None
+    ),
+    "Performance Analysis: Growth Opportunities": lambda numeric_cols, text_cols: (
+        f"Show records where {numeric_cols[0]} is below average and identify improvement opportunities"
+        if numeric_cols else None
+    ),
+    "Strategic Insights: Market Segmentation": lambda numeric_cols, text_cols: (
+        f"Group by {text_cols[0]} and show total performance with percentage breakdown"
+        if text_cols else None
+    ),
+    "Strategic Insights: Performance Comparison": lambda numeric_cols, text_cols: (
+        f"Compare average {numeric_cols[0]} across different {text_cols[0]} categories"
+        if text_cols and numeric_cols else None
+    ),
+    "ROI Analysis: Value Distribution": lambda numeric_cols, text_cols: (
+        f"Analyze {numeric_cols[0]} distribution showing quartiles and outliers for optimization"
+        if numeric_cols else None
+    ),
+    "ROI Analysis: Business Impact": lambda numeric_cols, text_cols: (
+        "Calculate total business value, average performance, and identify the 80/20 rule patterns"
+        if numeric_cols else None
+    ),
+}
+
+def below_average_rows(df, numeric_cols, text_cols):
+    """Growth Opportunities example: rows whose first numeric column is below its mean"""
+    col = numeric_cols[0]
+    threshold = df[col].mean()
+    sql_query = f'SELECT *\nFROM data\nWHERE "{col}" < (SELECT AVG("{col}") FROM data)'
+    return sql_query, df[df[col] < threshold].reset_index(drop=True)
+
+# Examples simple enough to answer with a pandas expression instead of a Claude
+# round-trip: label -> evaluator returning (equivalent SQL, result DataFrame)
+LOCAL_EXAMPLES = {
+    "Performance Analysis: Growth Opportunities": below_average_rows,
+}
+
+def local_example_result(natural_language, df, numeric_cols, text_cols):
+    """Answer an unedited example prompt locally, or None if it needs Claude"""
+    for label, evaluate in LOCAL_EXAMPLES.items():
+        if EXAMPLE_QUERIES[label](numeric_cols, text_cols) == natural_language:
+            return evaluate(df, numeric_cols, text_cols)
+    return None
+
+# Leading columns included in the sample rows sent to Claude
+PREVIEW_MAX_COLUMNS = 30
+
+# Rows of a result shipped to the browser table; the CSV export has them all
+RESULT_DISPLAY_ROWS = 500
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def column_types(df_key, _df):
+    """Column name -> dtype name of the upload, for the sidebar and the SQL prompt"""
+    return {col: dtype.name for col, dtype in _df.dtypes.items()}
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def schema_and_preview(df_key, _df):
+    """Schema listing and a column-bounded CSV sample of the upload for the SQL prompt"""
+    schema_info = "\n".join(f"{col}: {dtype}" for col, dtype in column_types(df_key, _df).items())
+    data_preview = _df.iloc[:3, :PREVIEW_MAX_COLUMNS].to_csv(index=False)
+    return schema_info, data_preview
+
+# Memoization chain: prompt -> SQL and SQL -> result are cached separately so
+# editing the prompt only invalidates the Claude leg. Both key on the upload
+# fingerprint; the DataFrame itself is passed unhashed (leading underscore).
+# The prompt leg is a plain bounded store rather than st.cache_data, which
+# would record every streamed redraw of the SQL and replay them all on a hit.
+SQL_CACHE_MAX_ENTRIES = 256
+SQL_CACHE_TTL_SECONDS = 3600
+
+@st.cache_resource(show_spinner=False)
+def sql_response_cache():
+    """Process-wide (upload fingerprint, prompt) -> (SQL, created at) store and its lock"""
+    return OrderedDict(), threading.Lock()
+
+def nl_to_sql(df_key, natural_language, schema_info, data_preview):
+    """Memoized natural language -> SQL, streamed into the page on a miss; failures are never cached"""
+    store, lock = sql_response_cache()
+    key = (df_key, natural_language)
+    with lock:
+        entry = store.get(key)
+        if entry is not None and time.monotonic() - entry[1] < SQL_CACHE_TTL_SECONDS:
+            store.move_to_end(key)
+            return entry[0]
     
-    # 5. MODERN MARKET SHARE ANALYSIS
-    if len(categorical_cols) > 0 and len(numeric_cols) > 0:
-        cat_col = categorical_cols[0]
-        
-        if len(df[cat_col].unique()) <= 10:
-            market_data = df.groupby(cat_col)[numeric_cols[0]].sum().reset_index()
-            
-            # Create modern donut chart
-            fig_pie = go.Figure(data=[go.Pie(
-                labels=market_data[cat_col],
-                values=market_data[numeric_cols[0]],
-                hole=0.4,
-                marker=dict(
-                    colors=MODERN_COLORS['primary'],
-                    line=dict(color='white', width=3)
-                ),
-                textfont=dict(size=14, family='Inter, Arial'),
-                textposition='auto',
-                textinfo='percent+label',
-                hovertemplate='<b>%{label}</b><br>Value: %{value:,.0f}<br>Percentage: %{percent}<extra></extra>'
-            )])
-            
-            # Add center text
-            total_value = market_data[numeric_cols[0]].sum()
-            fig_pie.add_annotation(
-                text=f"<b>Total<br>{total_value:,.0f}</b>",
-                x=0.5, y=0.5,
-                font_size=16,
-                showarrow=False,
-                font=dict(family='Inter, Arial', color=MODERN_COLORS['text'])
-            )
-            
-            fig_pie = apply_modern_formatting(
-                fig_pie, 
-                f"Market Share Distribution by {cat_col.replace('_', ' ').title()}",
-                500
-            )
-            fig_pie.update_layout(showlegend=True, legend=dict(orientation="v", x=1.05, y=0.5))
-            
-            charts.append(("Market Share Analysis", fig_pie))
+    # Only misses get here, so the log shows which prompts cost an API call
+    prompt_key = hashlib.blake2b(f"{df_key}\0{natural_language}".encode(), digest_size=8).hexdigest()
+    logger.info("SQL cache miss: prompt %s", prompt_key)
+    sql_query = generate_sql_query(natural_language, schema_info, data_preview)
     
-    # 6. ENHANCED DISTRIBUTION ANALYSIS
-    if len(numeric_cols) > 0:
-        primary_col = numeric_cols[0]
-        
-        # Create modern box plot with violin overlay
-        fig_dist = go.Figure()
-        
-        # Add violin plot for distribution shape
-        fig_dist.add_trace(go.Violin(
-            y=df[primary_col],
-            name='Distribution',
-            box_visible=True,
-            meanline_visible=True,
-            fillcolor=MODERN_COLORS['gradient'][0],
-            opacity=0.6,
-            line_color=MODERN_COLORS['gradient'][1],
-            hovertemplate='Value: %{y:,.0f}<extra></extra>'
-        ))
-        
-        # Add statistical reference lines
-        mean_val = df[primary_col].mean()
-        median_val = df[primary_col].median()
-        std_val = df[primary_col].std()
-        
-        fig_dist.add_hline(
-            y=mean_val, line_dash="dash", line_color="#e74c3c", line_width=2,
-            annotation_text=f"Mean: {mean_val:,.0f}",
-            annotation=dict(bgcolor="rgba(231,76,60,0.8)", font=dict(color="white"))
-        )
-        fig_dist.add_hline(
-            y=median_val, line_dash="solid", line_color="#27ae60", line_width=2,
-            annotation_text=f"Median: {median_val:,.0f}",
-            annotation=dict(bgcolor="rgba(39,174,96,0.8)", font=dict(color="white"))
-        )
-        
-        # Add standard deviation bands
-        fig_dist.add_hrect(
-            y0=mean_val - std_val, y1=mean_val + std_val,
-            fillcolor="rgba(52,152,219,0.1)", line_width=0,
-            annotation_text="±1 Std Dev", annotation_position="top left"
+    with lock:
+        store[key] = (sql_query, time.monotonic())
+        store.move_to_end(key)
+        while len(store) > SQL_CACHE_MAX_ENTRIES:
+            store.popitem(last=False)
+    return sql_query
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def sql_to_df(df_key, sql_query, _df):
+    """Memoized SQL -> result DataFrame for the uploaded data"""
+    return execute_sql_on_dataframe(_df, sql_query, df_key=df_key)
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def sql_to_explanation(df_key, sql_query, _result_df):
+    """Memoized business insights for the result of sql_query on the upload"""
+    return explain_results(_result_df, sql_query)
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def sql_to_chart_plan(df_key, sql_query, _result_df):
+    """Memoized (column metadata, dashboard chart names) for the result of sql_query"""
+    return chart_plan(_result_df)
+
+# Figures are built one at a time as their tab is opened and kept as live
+# objects (cache_resource) rather than pickled per hit
+@st.cache_resource(max_entries=64, show_spinner=False)
+def sql_to_chart(df_key, sql_query, name, _result_df):
+    """Memoized dashboard figure `name` for the result of sql_query on the upload"""
+    meta, _ = sql_to_chart_plan(df_key, sql_query, _result_df)
+    return CHART_BUILDER_BY_NAME[name](_result_df, meta)
+
+@st.cache_data(ttl=3600, max_entries=32, show_spinner=False)
+def sql_to_csv(df_key, sql_query, _result_df):
+    """Memoized CSV export of a query result, as bytes ready for download"""
+    # One writer for every size, so the download's format never depends on row count
+    buffer = BytesIO()
+    _result_df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+# Column-name tokens that mark a numeric column as money (shown with a $ prefix)
+CURRENCY_TOKENS = ('spend', 'revenue', 'cost', 'price', 'amount')
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def currency_columns(columns):
+    """Subset of a tuple of column names that hold currency values"""
+    return frozenset(c for c in columns if any(tok in c.lower() for tok in CURRENCY_TOKENS))
+
+
+
+# MODERN COLOR PALETTE
+MODERN_COLORS = {
+    'primary': ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd'],
+    'gradient': ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe'],
+    'performance': ['#e74c3c', '#f39c12', '#f1c40f', '#2ecc71', '#27ae60'],
+    'background': 'rgba(248,249,250,0.95)',
+    'text': '#2c3e50'
+}
+
+# STANDARDIZED FORMATTING, built once. Kept as explicit layout values rather
+# than a Plotly template: Streamlit's chart theme replaces template styling,
+# while layout set on the figure wins.
+MODERN_TITLE = {
+    'x': 0.5,
+    'xanchor': 'center',
+    'font': {'size': 20, 'family': 'Inter, Arial', 'color': MODERN_COLORS['text']},
+    'pad': {'t': 20, 'b': 20}
+}
+MODERN_LAYOUT = dict(
+    paper_bgcolor=MODERN_COLORS['background'],
+    plot_bgcolor='rgba(255,255,255,0.98)',
+    font=dict(family="Inter, Arial", size=13, color=MODERN_COLORS['text']),
+    margin=dict(l=80, r=80, t=100, b=80),
+    showlegend=True,
+    hovermode='closest'
+)
+# Modern grid styling
+MODERN_AXIS = dict(
+    gridcolor='rgba(200,200,200,0.2)',
+    gridwidth=1,
+    zeroline=False,
+    showline=True,
+    linecolor='rgba(200,200,200,0.5)'
+)
+
+def apply_modern_formatting(fig, title, height=550):
+    """Apply modern, professional formatting to all charts"""
+    fig.update_layout(
+        title={**MODERN_TITLE, 'text': f"<b style='font-size:20px'>{title}</b>"},
+        height=height,
+        **MODERN_LAYOUT
+    )
+    fig.update_xaxes(MODERN_AXIS)
+    fig.update_yaxes(MODERN_AXIS)
+
+    return fig
+
+# Row-level traces above this many points are sampled or pre-binned so the
+# browser isn't sent every row; summary statistics still use the full data
+CHART_MAX_POINTS = 10_000
+
+def chart_sample(series):
+    """Random sample of at most CHART_MAX_POINTS values for a row-level trace"""
+    if len(series) > CHART_MAX_POINTS:
+        return series.sample(CHART_MAX_POINTS, random_state=0)
+    return series
+
+# 1. MODERN KPI DASHBOARD - METRIC CARDS STYLE
+def build_kpi_dashboard(df, meta):
+    """Executive KPI gauges for up to six numeric columns"""
+    numeric_cols = meta['numeric_cols']
+
+    # Create subplot grid for modern metric cards
+    rows = 2 if len(numeric_cols) > 3 else 1
+    cols = min(3, len(numeric_cols))
+
+    fig_kpi = make_subplots(
+        rows=rows,
+        cols=cols,
+        subplot_titles=[col.replace('_', ' ').title() for col in numeric_cols[:6]],
+        specs=[[{'type': 'indicator'}] * cols for _ in range(rows)],
+        vertical_spacing=0.3,
+        horizontal_spacing=0.15
+    )
+
+    # Add modern gauge/indicator charts
+    for i, col in enumerate(numeric_cols[:6]):
+        row = (i // cols) + 1
+        col_pos = (i % cols) + 1
+
+        total_val = df[col].sum()
+        avg_val = df[col].mean()
+        max_val = df[col].max()
+
+        # Calculate performance percentage (relative to max)
+        performance_pct = (avg_val / max_val * 100) if max_val > 0 else 0
+
+        # Determine color based on performance
+        if performance_pct >= 75:
+            color = MODERN_COLORS['performance'][4]  # Green
+        elif performance_pct >= 50:
+            color = MODERN_COLORS['performance'][3]  # Light green
+        elif performance_pct >= 25:
+            color = MODERN_COLORS['performance'][1]  # Orange
+        else:
+            color = MODERN_COLORS['performance'][0]  # Red
+
+        # Format value based on column type
+        if 'spend' in col.lower() or 'cost' in col.lower() or 'revenue' in col.lower():
+            value_text = f"${total_val:,.0f}"
+            reference_text = f"Avg: ${avg_val:,.0f}"
+        else:
+            value_text = f"{total_val:,.0f}"
+            reference_text = f"Avg: {avg_val:,.0f}"
+
+        fig_kpi.add_trace(
+            go.Indicator(
+                mode="number+gauge+delta",
+                value=total_val,
+                delta={'reference': avg_val * len(df), 'relative': True, 'valueformat': '.1%'},
+                gauge={
+                    'axis': {'range': [0, max_val * len(df)]},
+                    'bar': {'color': color, 'thickness': 0.8},
+                    'bgcolor': "rgba(255,255,255,0.8)",
+                    'borderwidth': 2,
+                    'bordercolor': color,
+                    'steps': [
+                        {'range': [0, max_val * len(df) * 0.5], 'color': "rgba(200,200,200,0.2)"},
+                        {'range': [max_val * len(df) * 0.5, max_val * len(df) * 0.8], 'color': "rgba(255,193,7,0.3)"},
+                        {'range': [max_val * len(df) * 0.8, max_val * len(df)], 'color': "rgba(40,167,69,0.3)"}
+                    ],
+                    'threshold': {
+                        'line': {'color': MODERN_COLORS['text'], 'width': 3},
+                        'thickness': 0.8,
+                        'value': avg_val * len(df)
+                    }
+                },
+                number={'font': {'size': 24, 'family': 'Inter, Arial'}},
+                title={'text': f"<br><span style='font-size:12px'>{reference_text}</span>"}
+            ),
+            row=row, col=col_pos
         )
-        
-        fig_dist = apply_modern_formatting(
-            fig_dist, 
-            f"Distribution Analysis: {primary_col.replace('_', ' ').title()}",
-            500
+
+    fig_kpi.update_layout(
+        title={
+            'text': "<b style='font-size:24px'>Executive Performance Dashboard</b>",
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {'size': 24, 'family': 'Inter, Arial', 'color': MODERN_COLORS['text']}
+        },
+        height=450 if rows == 1 else 700,
+        paper_bgcolor=MODERN_COLORS['background'],
+        font=dict(family="Inter, Arial", size=12),
+        margin=dict(l=60, r=60, t=120, b=60)
+    )
+
+    return fig_kpi
+
+# 2. ENHANCED CORRELATION ANALYSIS
+# Largest correlation matrix drawn; wider results keep their highest-variance columns
+CORRELATION_MAX_COLUMNS = 20
+
+def build_correlation_matrix(df, meta):
+    """Correlation heatmap with strength annotations"""
+    # Wide results keep only their most variable columns: the matrix and its
+    # annotations grow with the square of the column count
+    corr_cols = meta['numeric_cols']
+    if len(corr_cols) > CORRELATION_MAX_COLUMNS:
+        top = set(df[corr_cols].var().nlargest(CORRELATION_MAX_COLUMNS).index)
+        corr_cols = [col for col in corr_cols if col in top]
+    correlation_data = df[corr_cols].corr()
+
+    # Create modern correlation heatmap
+    fig_corr = go.Figure(data=go.Heatmap(
+        z=correlation_data.values,
+        x=correlation_data.columns,
+        y=correlation_data.columns,
+        colorscale='RdBu_r',
+        zmid=0,
+        zmin=-1,
+        zmax=1,
+        text=correlation_data.round(2).values,
+        texttemplate="%{text}",
+        textfont={"size": 14, "color": "white"},
+        hoverongaps=False,
+        hovertemplate='<b>%{y} vs %{x}</b><br>Correlation: %{z:.3f}<extra></extra>'
+    ))
+
+    # Add correlation strength annotations (collected, then set in one update)
+    annotations = []
+    for i in range(len(correlation_data.columns)):
+        for j in range(len(correlation_data.columns)):
+            if i != j:
+                corr_val = correlation_data.iloc[i, j]
+                if abs(corr_val) >= 0.7:
+                    strength = "Strong"
+                    color = "white"
+                elif abs(corr_val) >= 0.3:
+                    strength = "Moderate"
+                    color = "black"
+                else:
+                    strength = "Weak"
+                    color = "gray"
+
+                annotations.append(dict(
+                    x=j, y=i,
+                    text=f"<b>{strength}</b>",
+                    showarrow=False,
+                    font=dict(color=color, size=10),
+                    yshift=15
+                ))
+    fig_corr.update_layout(annotations=annotations)
+
+    fig_corr = apply_modern_formatting(fig_corr, "Performance Correlation Matrix", 550)
+    return fig_corr
+
+# 3. MODERN ROI ANALYSIS WITH STRATEGIC ZONES
+def build_roi_analysis(df, meta):
+    """ROI ratio histogram banded into strategic performance zones"""
+    numeric_cols = meta['numeric_cols']
+    primary_metric = numeric_cols[0]
+    secondary_metric = numeric_cols[1] if len(numeric_cols) > 1 else numeric_cols[0]
+
+    # Calculate ROI ratio (only this pair is plotted, so no full-frame copy);
+    # zero denominators count as 1
+    denominator = df[secondary_metric].to_numpy(dtype=np.float64, na_value=np.nan)
+    roi_ratio = pd.Series(
+        df[primary_metric].to_numpy(dtype=np.float64, na_value=np.nan)
+        / np.where(denominator == 0, 1.0, denominator)
+    )
+
+    # Create strategic zones histogram
+    fig_roi = go.Figure()
+
+    # Large results are pre-binned finely and summed client-side, so the trace
+    # carries at most 1,000 weighted points instead of every row
+    hist_data = {'x': roi_ratio}
+    if len(roi_ratio) > CHART_MAX_POINTS:
+        counts, edges = np.histogram(roi_ratio[np.isfinite(roi_ratio)], bins=1000)
+        centers = (edges[:-1] + edges[1:]) / 2
+        hist_data = {'x': centers[counts > 0], 'y': counts[counts > 0], 'histfunc': 'sum'}
+
+    # Add histogram
+    fig_roi.add_trace(go.Histogram(
+        **hist_data,
+        nbinsx=20,
+        name='ROI Distribution',
+        marker=dict(
+            color=MODERN_COLORS['gradient'][0],
+            opacity=0.8,
+            line=dict(color='white', width=1)
+        ),
+        hovertemplate='ROI Range: %{x}<br>Count: %{y}<extra></extra>'
+    ))
+
+    # Calculate strategic zones (one sort for all four cut points)
+    roi_25th, roi_50th, roi_75th, roi_90th = roi_ratio.quantile([0.25, 0.50, 0.75, 0.90])
+
+    # Add strategic zone backgrounds
+    fig_roi.add_vrect(
+        x0=roi_ratio.min(), x1=roi_25th,
+        fillcolor="rgba(231,76,60,0.2)", line_width=0,
+        annotation_text="Needs Attention", annotation_position="top left"
+    )
+    fig_roi.add_vrect(
+        x0=roi_25th, x1=roi_75th,
+        fillcolor="rgba(241,196,15,0.2)", line_width=0,
+        annotation_text="Average Performance", annotation_position="top"
+    )
+    fig_roi.add_vrect(
+        x0=roi_75th, x1=roi_90th,
+        fillcolor="rgba(46,204,113,0.2)", line_width=0,
+        annotation_text="Good Performance", annotation_position="top"
+    )
+    fig_roi.add_vrect(
+        x0=roi_90th, x1=roi_ratio.max(),
+        fillcolor="rgba(39,174,96,0.3)", line_width=0,
+        annotation_text="Excellent", annotation_position="top right"
+    )
+
+    # Add benchmark lines
+    fig_roi.add_vline(
+        x=roi_50th, line_dash="solid", line_color="#e74c3c", line_width=3,
+        annotation_text=f"Median: {roi_50th:.2f}", annotation_position="top"
+    )
+    fig_roi.add_vline(
+        x=roi_75th, line_dash="dash", line_color="#27ae60", line_width=2,
+        annotation_text=f"Top 25%: {roi_75th:.2f}", annotation_position="bottom right"
+    )
+
+    fig_roi = apply_modern_formatting(
+        fig_roi,
+        f"ROI Strategic Analysis: {primary_metric.replace('_', ' ').title()}/{secondary_metric.replace('_', ' ').title()}"
+    )
+    fig_roi.update_layout(showlegend=False)
+
+    return fig_roi
+
+# 4. ENHANCED PERFORMANCE COMPARISON
+def build_performance_comparison(df, meta):
+    """Average of the primary metric per category against the overall average"""
+    numeric_cols = meta['numeric_cols']
+    cat_col = meta['categorical_cols'][0]
+    comparison_data = df.groupby(cat_col, observed=True)[numeric_cols[0]].agg(['mean', 'sum', 'count']).reset_index()
+    comparison_data.columns = [cat_col, 'average', 'total', 'count']
+
+    # Create modern bar chart with gradient colors
+    fig_comparison = go.Figure()
+
+    # Sort by average for better visualization
+    comparison_data = comparison_data.sort_values('average', ascending=True)
+
+    # Add bars with gradient coloring
+    fig_comparison.add_trace(go.Bar(
+        x=comparison_data[cat_col],
+        y=comparison_data['average'],
+        name='Average Performance',
+        marker=dict(
+            color=comparison_data['average'],
+            colorscale='Viridis',
+            colorbar=dict(title="Performance Level"),
+            line=dict(color='white', width=2)
+        ),
+        text=comparison_data['average'].apply(lambda x: f"{x:,.0f}"),
+        textposition='outside',
+        textfont=dict(size=12, family='Inter, Arial'),
+        hovertemplate='<b>%{x}</b><br>Average: %{y:,.0f}<br>Total: %{customdata:,.0f}<extra></extra>',
+        customdata=comparison_data['total']
+    ))
+
+    # Add overall average line with better styling
+    overall_avg = df[numeric_cols[0]].mean()
+    fig_comparison.add_hline(
+        y=overall_avg,
+        line_dash="dash",
+        line_color="#e74c3c",
+        line_width=3,
+        annotation_text=f"Overall Average: {overall_avg:,.0f}",
+        annotation_position="top right",
+        annotation=dict(
+            bgcolor="rgba(231,76,60,0.8)",
+            bordercolor="white",
+            font=dict(color="white", size=12)
         )
-        fig_dist.update_layout(showlegend=False)
-        
-        charts.append(("Distribution Analytics", fig_dist))
-    
-    return charts
+    )
+
+    fig_comparison = apply_modern_formatting(
+        fig_comparison,
+        f"Performance Comparison by {cat_col.replace('_', ' ').title()}"
+    )
+    fig_comparison.update_layout(
+        xaxis=dict(tickangle=45, categoryorder='total ascending'),
+        showlegend=False
+    )
+
+    return fig_comparison
+
+# 5. MODERN MARKET SHARE ANALYSIS
+def build_market_share(df, meta):
+    """Donut chart of the primary metric per category (10 categories max)"""
+    numeric_cols = meta['numeric_cols']
+    cat_col = meta['categorical_cols'][0]
+
+    market_data = df.groupby(cat_col, observed=True)[numeric_cols[0]].sum().reset_index()
+
+    # Create modern donut chart
+    fig_pie = go.Figure(data=[go.Pie(
+        labels=market_data[cat_col],
+        values=market_data[numeric_cols[0]],
+        hole=0.4,
+        marker=dict(
+            colors=MODERN_COLORS['primary'],
+            line=dict(color='white', width=3)
+        ),
+        textfont=dict(size=14, family='Inter, Arial'),
+        textposition='auto',
+        textinfo='percent+label',
+        hovertemplate='<b>%{label}</b><br>Value: %{value:,.0f}<br>Percentage: %{percent}<extra></extra>'
+    )])
+
+    # Add center text
+    total_value = market_data[numeric_cols[0]].sum()
+    fig_pie.add_annotation(
+        text=f"<b>Total<br>{total_value:,.0f}</b>",
+        x=0.5, y=0.5,
+        font_size=16,
+        showarrow=False,
+        font=dict(family='Inter, Arial', color=MODERN_COLORS['text'])
+    )
+
+    fig_pie = apply_modern_formatting(
+        fig_pie,
+        f"Market Share Distribution by {cat_col.replace('_', ' ').title()}",
+        500
+    )
+    fig_pie.update_layout(showlegend=True, legend=dict(orientation="v", x=1.05, y=0.5))
+
+    return fig_pie
+
+# 6. ENHANCED DISTRIBUTION ANALYSIS
+def build_distribution(df, meta):
+    """Violin plot of the primary metric with mean/median/std reference lines"""
+    primary_col = meta['numeric_cols'][0]
+
+    # Create modern box plot with violin overlay
+    fig_dist = go.Figure()
+
+    # Add violin plot for distribution shape
+    fig_dist.add_trace(go.Violin(
+        y=chart_sample(df[primary_col]),
+        name='Distribution',
+        box_visible=True,
+        meanline_visible=True,
+        fillcolor=MODERN_COLORS['gradient'][0],
+        opacity=0.6,
+        line_color=MODERN_COLORS['gradient'][1],
+        hovertemplate='Value: %{y:,.0f}<extra></extra>'
+    ))
+
+    # Add statistical reference lines (from the full column, not the plotted sample)
+    mean_val, median_val, std_val = df[primary_col].agg(['mean', 'median', 'std'])
+
+    fig_dist.add_hline(
+        y=mean_val, line_dash="dash", line_color="#e74c3c", line_width=2,
+        annotation_text=f"Mean: {mean_val:,.0f}",
+        annotation=dict(bgcolor="rgba(231,76,60,0.8)", font=dict(color="white"))
+    )
+    fig_dist.add_hline(
+        y=median_val, line_dash="solid", line_color="#27ae60", line_width=2,
+        annotation_text=f"Median: {median_val:,.0f}",
+        annotation=dict(bgcolor="rgba(39,174,96,0.8)", font=dict(color="white"))
+    )
+
+    # Add standard deviation bands
+    fig_dist.add_hrect(
+        y0=mean_val - std_val, y1=mean_val + std_val,
+        fillcolor="rgba(52,152,219,0.1)", line_width=0,
+        annotation_text="±1 Std Dev", annotation_position="top left"
+    )
+
+    fig_dist = apply_modern_formatting(
+        fig_dist,
+        f"Distribution Analysis: {primary_col.replace('_', ' ').title()}",
+        500
+    )
+    fig_dist.update_layout(showlegend=False)
+
+    return fig_dist
+
+# Chart dispatch table: (tab name, predicate on column metadata, builder) in
+# display order. Builders only read df/meta and return the figure.
+CHART_BUILDERS = [
+    ("Executive Performance Dashboard", lambda meta: len(meta['numeric_cols']) >= 1, build_kpi_dashboard),
+    ("Correlation Analysis", lambda meta: len(meta['numeric_cols']) >= 2, build_correlation_matrix),
+    ("ROI Strategic Analysis", lambda meta: len(meta['numeric_cols']) >= 2, build_roi_analysis),
+    ("Performance Benchmarking", lambda meta: len(meta['categorical_cols']) > 0, build_performance_comparison),
+    ("Market Share Analysis", lambda meta: len(meta['categorical_cols']) > 0 and meta['category_count'] <= 10, build_market_share),
+    ("Distribution Analytics", lambda meta: len(meta['numeric_cols']) > 0, build_distribution),
+]
+CHART_BUILDER_BY_NAME = {name: builder for name, _, builder in CHART_BUILDERS}
+
+# Business context shown under each dashboard tab, keyed by chart name
+CHART_INSIGHTS = {
+    "Executive Performance Dashboard": " **Insight**: Comprehensive performance overview with benchmarks and targets",
+    "Correlation Analysis": " **Insight**: Understand relationships between metrics for strategic planning",
+    "ROI Strategic Analysis": " **Insight**: Financial efficiency and optimization opportunities",
+    "Performance Benchmarking": " **Insight**: Performance comparison against industry averages",
+    "Market Share Analysis": " **Insight**: Competitive positioning and market concentration analysis",
+    "Distribution Analytics": " **Insight**: Statistical analysis with quartiles and outlier detection",
+}
+
+# Summary charts gain nothing from pan/zoom/hover, so they render as static images
+STATIC_CHARTS = {"Executive Performance Dashboard", "Correlation Analysis"}
+STATIC_CHART_CONFIG = {'staticPlot': True, 'displayModeBar': False}
+INTERACTIVE_CHART_CONFIG = {
+    'displayModeBar': True,
+    'displaylogo': False,
+    'modeBarButtonsToRemove': ['pan2d', 'lasso2d']
+}
+
+# ID-like column names: id/index/rank as a whole word or snake_case part, or a
+# camelCase Id/ID suffix. Substrings alone don't count ("paid_amount", "width").
+ID_COLUMN_RE = re.compile(r'(?:^|[_\s])(?:id|index|rank)(?:$|[_\s])|(?-i:[a-z](?:Id|ID)$)', re.IGNORECASE)
+
+def chart_plan(df):
+    """Column metadata and the names of the dashboard charts that apply to a result"""
+    if df.empty:
+        return None, []
+
+    # Detect numeric and categorical columns
+    numeric_cols, categorical_cols = split_columns(df)
+
+    # Remove any ID-like columns from numeric analysis
+    numeric_cols = [col for col in numeric_cols if not ID_COLUMN_RE.search(col)]
 
+    if len(numeric_cols) == 0:
+        return None, []
 
+    meta = {
+        'numeric_cols': numeric_cols,
+        'categorical_cols': categorical_cols,
+        'category_count': len(df[categorical_cols[0]].unique()) if categorical_cols else 0,
+    }
+    return meta, [name for name, predicate, _ in CHART_BUILDERS if predicate(meta)]
 
 def explain_results(df, sql_query):
     """Generate compelling business insights from results"""
@@ -647,14 +1088,12 @@ def explain_results(df, sql_query):
         insights.append(f"**Data Analysis**: Processed {len(df):,} records across {len(df.columns)} business metrics")
         
         # Financial Impact Analysis
-        numeric_cols = df.select_dtypes(include=['number']).columns
+        numeric_cols, categorical_cols = split_columns(df)
         if len(numeric_cols) > 0:
+            # All five statistics for the top 2 numeric columns in one pass
+            stats = df[numeric_cols[:2]].agg(['sum', 'mean', 'max', 'min', 'std'])
             for i, col in enumerate(numeric_cols[:2]):  # Top 2 numeric columns
-                total = df[col].sum()
-                avg = df[col].mean()
-                max_val = df[col].max()
-                min_val = df[col].min()
-                std_dev = df[col].std()
+                total, avg, max_val, min_val, std_dev = stats[col]
                 
                 col_name = col.replace('_', ' ').title()
                 
@@ -680,14 +1119,14 @@ def explain_results(df, sql_query):
                     insights.append(f"- **Variability Index**: {(std_dev/avg)*100:.1f}% (Higher = More optimization opportunity)")
         
         # Market Segmentation Analysis
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
         if len(categorical_cols) > 0:
             insights.append("")
             insights.append("### **MARKET SEGMENTATION INSIGHTS**")
             
             for col in categorical_cols[:1]:  # Focus on primary category
                 unique_count = df[col].nunique()
-                top_category = df[col].value_counts().index[0] if len(df) > 0 else "N/A"
+                segment_counts = df[col].value_counts()
+                top_category = segment_counts.index[0] if len(df) > 0 else "N/A"
                 col_name = col.replace('_', ' ').title()
                 
                 insights.append(f"**{col_name}**: {unique_count} distinct segments identified")
@@ -695,7 +1134,7 @@ def explain_results(df, sql_query):
                 
                 # Calculate market concentration
                 if len(df) > 1:
-                    market_share = (df[col].value_counts().iloc[0] / len(df)) * 100
+                    market_share = (segment_counts.iloc[0] / len(df)) * 100
                     insights.append(f"**Market Concentration**: Top segment holds {market_share:.1f}% market share")
         
         # Strategic Recommendations Section
@@ -732,7 +1171,7 @@ def explain_results(df, sql_query):
         insights.append("### **ESTIMATED BUSINESS IMPACT**")
         
         if len(numeric_cols) > 0:
-            primary_value = df[numeric_cols[0]].sum()
+            primary_value = stats.at['sum', numeric_cols[0]]
             improvement_value = primary_value * 0.20  # 20% improvement potential
             
             insights.append(f"**Current Portfolio Value**: ${primary_value:,.0f}")
@@ -793,31 +1232,9 @@ def main():
         st.success("Pro user: Unlimited queries")
     
     # Competitive advantages display
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.markdown("""
-        <div class="competitive-advantage">
-        <h4>Privacy First</h4>
-        <p>No database credentials needed. Your data never leaves this session.</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown("""
-        <div class="competitive-advantage">
-        <h4>Execute & Visualize</h4>
-        <p>Run SQL on your data and get instant charts. No copy-paste needed.</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown("""
-        <div class="competitive-advantage">
-        <h4>Smart Learning</h4>
-        <p>Remembers your data patterns for better query suggestions.</p>
-        </div>
-        """, unsafe_allow_html=True)
+    for col, html in zip(st.columns(3), COMPETITIVE_ADVANTAGE_HTML):
+        with col:
+            st.markdown(html, unsafe_allow_html=True)
     
     # Sidebar for file upload
     with st.sidebar:
@@ -831,20 +1248,22 @@ def main():
         if uploaded_file:
             # Load data
             try:
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
+                # Fingerprint the raw upload bytes so every cache keys on one short
+                # string instead of Streamlit deep-hashing the whole DataFrame per call
+                raw = uploaded_file.getvalue()
+                df_key = hashlib.blake2b(raw, digest_size=16).hexdigest()
+                df = load_dataframe(df_key, uploaded_file.name, raw)
                 
                 st.success(f"Loaded {len(df)} rows, {len(df.columns)} columns")
                 
+                st.session_state.df_key = df_key
+                
                 # Show data preview
                 with st.expander("Data Preview"):
                     st.dataframe(df.head())
                 
                 # Schema info
-                schema_info = {col: str(df[col].dtype) for col in df.columns}
-                st.json(schema_info)
+                st.json(column_types(df_key, df))
                 
             except Exception as e:
                 st.error(f"Error loading file: {str(e)}")
@@ -862,98 +1281,63 @@ def main():
         st.header(" Ask Your Data Anything")
         
         # Enhanced example queries with better diversity
-        st.markdown("###  **Business Intelligence Examples** (Click to Try)")
-        
-        example_col1, example_col2, example_col3 = st.columns(3)
+        st.markdown("###  **Business Intelligence Examples** (Pick One to Try)")
         
-        with example_col1:
-            st.markdown("####  **Performance Analysis**")
-            if st.button(" Top Performers by Revenue", key="top_performers", help="Identify your highest-value segments"):
-                if df.select_dtypes(include=['number']).columns.any():
-                    numeric_col = df.select_dtypes(include=['number']).columns[0]
-                    natural_language = f"Show me the top 10 records ordered by {numeric_col} in descending order"
-                    st.session_state.query_input = natural_language
-                    st.session_state.auto_execute = True
-                    st.rerun()
-            
-            if st.button(" Growth Opportunities", key="growth_ops", help="Find underperforming segments with potential"):
-                if df.select_dtypes(include=['number']).columns.any():
-                    numeric_col = df.select_dtypes(include=['number']).columns[0]
-                    natural_language = f"Show records where {numeric_col} is below average and identify improvement opportunities"
-                    st.session_state.query_input = natural_language
-                    st.session_state.auto_execute = True
-                    st.rerun()
+        # Classify columns once per rerun for the example builders
+        numeric_cols, text_cols = split_columns(df)
         
-        with example_col2:
-            st.markdown("####  **Strategic Insights**")
-            if st.button(" Market Segmentation", key="segmentation", help="Analyze your customer/market segments"):
-                text_cols = df.select_dtypes(include=['object']).columns
-                if len(text_cols) > 0:
-                    natural_language = f"Group by {text_cols[0]} and show total performance with percentage breakdown"
-                    st.session_state.query_input = natural_language
-                    st.session_state.auto_execute = True
-                    st.rerun()
-            
-            if st.button(" Performance Comparison", key="comparison", help="Compare performance across categories"):
-                if len(df.select_dtypes(include=['object']).columns) > 0 and len(df.select_dtypes(include=['number']).columns) > 0:
-                    text_col = df.select_dtypes(include=['object']).columns[0]
-                    num_col = df.select_dtypes(include=['number']).columns[0]
-                    natural_language = f"Compare average {num_col} across different {text_col} categories"
-                    st.session_state.query_input = natural_language
-                    st.session_state.auto_execute = True
-                    st.rerun()
-        
-        with example_col3:
-            st.markdown("####  **ROI Analysis**")
-            if st.button(" Value Distribution", key="value_dist", help="Understand your value distribution patterns"):
-                if df.select_dtypes(include=['number']).columns.any():
-                    numeric_col = df.select_dtypes(include=['number']).columns[0]
-                    natural_language = f"Analyze {numeric_col} distribution showing quartiles and outliers for optimization"
-                    st.session_state.query_input = natural_language
-                    st.session_state.auto_execute = True
-                    st.rerun()
-            
-            if st.button(" Business Impact", key="impact", help="Calculate total business impact and ROI"):
-                numeric_cols = df.select_dtypes(include=['number']).columns
-                if len(numeric_cols) > 0:
-                    natural_language = f"Calculate total business value, average performance, and identify the 80/20 rule patterns"
-                    st.session_state.query_input = natural_language
-                    st.session_state.auto_execute = True
-                    st.rerun()
+        example_label = st.selectbox(
+            "Pick an analysis",
+            list(EXAMPLE_QUERIES),
+            help="Each example is tailored to the columns in your upload"
+        )
+        # The text area below isn't instantiated yet this run, so its value can be
+        # set here and the example executed in the same pass without st.rerun()
+        auto_execute = False
+        if st.button(" Use Example", key="use_example"):
+            natural_language = EXAMPLE_QUERIES[example_label](numeric_cols, text_cols)
+            if natural_language:
+                st.session_state.main_query_input = natural_language
+                auto_execute = True
+            else:
+                st.warning("This example needs columns your data doesn't have - try another one.")
         
         # Natural language input with enhanced styling
         st.markdown("---")
         st.markdown("###  **Custom Business Question**")
         st.markdown("*Describe your analysis needs in plain English - our AI will handle the complex SQL*")
         
-        # Query input with enhanced styling and auto-population
+        # Query input with enhanced styling, auto-populated by the examples via its key
         query_input = st.text_area(
             "What insights do you need from your data?",
-            value=st.session_state.get('query_input', ''),
             height=120,
             placeholder="e.g., 'Compare Q4 performance across regions and identify the biggest growth opportunities' or 'Show me ROI analysis by customer segment with budget reallocation recommendations'",
             help="Pro tip: Be specific about what business decisions you're trying to make",
             key="main_query_input"
         )
         
-        # Update session state when input changes
-        if query_input != st.session_state.get('query_input', ''):
-            st.session_state.query_input = query_input
-        
         # Enhanced generate button
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            generate_button = st.button(
+            generate_clicked = st.button(
                 " Generate Executive Analysis", 
                 type="primary",
                 help="Get instant SQL + charts + strategic insights",
-                use_container_width=True
-            ) or st.session_state.get('auto_execute', False)
+                width="stretch"
+            )
+            generate_button = generate_clicked or auto_execute
             
-            if generate_button and query_input:
-                # Reset auto_execute flag
-                if 'auto_execute' in st.session_state:
-                    del st.session_state.auto_execute
+            # Same prompt on the same upload: an auto re-run keeps the results on screen
+            run_key = (query_input, st.session_state.df_key)
+            results = st.session_state.get('results')
+            repeat_run = (
+                auto_execute and not generate_clicked
+                and results is not None and results['key'] == run_key
+            )
+            
+            if generate_button and query_input and not repeat_run:
+                result_df = None
+                local_result = local_example_result(query_input, df, numeric_cols, text_cols)
                 
                 # Check usage limit
                 if not check_usage_limit():
@@ -964,205 +1348,168 @@ def main():
                 if st.session_state.get('user_email') is None:
                     increment_usage()
                 
-                with st.spinner(" Generating SQL with Claude AI..."):
-                    # Generate SQL
-                    schema_info = "\n".join([f"{col}: {dtype}" for col, dtype in zip(df.columns, df.dtypes)])
-                    data_preview = df.head(3).to_string()
+                if local_result is not None:
+                    # Canned example answered in pandas: no Claude call, no SQL engine
+                    sql_query, result_df = local_result
+                else:
+                    # Generate SQL (streamed into the page as Claude writes it)
+                    schema_info, data_preview = schema_and_preview(st.session_state.df_key, df)
                     
-                    sql_query = generate_sql_query(query_input, schema_info, data_preview)
+                    # Collapse whitespace so re-typed prompts that differ only in
+                    # spacing or line breaks hit the cached SQL instead of Claude
+                    prompt = " ".join(query_input.split())
+                    try:
+                        sql_query = nl_to_sql(st.session_state.df_key, prompt, schema_info, data_preview)
+                    except Exception as e:
+                        st.error(f"Error generating SQL: {str(e)}")
+                        sql_query = None
                 
                 if sql_query:
-                    # Display generated SQL
-                    st.subheader(" Generated SQL Query")
-                    st.code(sql_query, language="sql")
-                    
                     # Execute SQL
-                    with st.spinner(" Executing query..."):
-                        result_df = execute_sql_on_dataframe(df, sql_query)
+                    if result_df is None:
+                        with st.spinner(" Executing query..."):
+                            result_df = sql_to_df(st.session_state.df_key, sql_query, df)
                     
-                    if result_df is not None:
-                        # Display results with enhanced styling
-                        st.subheader(" Query Results")
-                        
-                        # Add comprehensive key metrics at the top
-                        if len(result_df) > 0:
-                            numeric_cols = result_df.select_dtypes(include=['number']).columns.tolist()
-                            categorical_cols = result_df.select_dtypes(include=['object']).columns.tolist()
-                            
-                            # Dynamic metrics based on available columns
-                            metric_cols = st.columns(min(5, len(numeric_cols) + 2))
-                            
-                            # Always show record count
-                            with metric_cols[0]:
-                                st.metric(
-                                    label=" Records Found", 
-                                    value=f"{len(result_df):,}",
-                                    delta=f"{len(result_df)} rows"
-                                )
-                            
-                            # Show metrics for each numeric column
-                            for i, col in enumerate(numeric_cols[:4]):  # Up to 4 numeric metrics
-                                if i + 1 < len(metric_cols):
-                                    with metric_cols[i + 1]:
-                                        total_val = result_df[col].sum()
-                                        avg_val = result_df[col].mean()
-                                        
-                                        st.metric(
-                                            label=f" Total {col.replace('_', ' ').title()}", 
-                                            value=f"${total_val:,.0f}" if 'spend' in col.lower() or 'revenue' in col.lower() else f"{total_val:,.0f}",
-                                            delta=f"Avg: {avg_val:,.0f}"
-                                        )
-                            
-                            # Show categorical summary if space allows
-                            if len(categorical_cols) > 0 and len(metric_cols) > len(numeric_cols) + 1:
-                                with metric_cols[-1]:
-                                    unique_count = result_df[categorical_cols[0]].nunique()
-                                    st.metric(
-                                        label=f" Unique {categorical_cols[0].replace('_', ' ').title()}", 
-                                        value=f"{unique_count}",
-                                        delta="Segments"
-                                    )
+                    # Keep the run so later reruns (downloads, edits) render it from memory
+                    results = st.session_state.results = {'key': run_key, 'sql': sql_query, 'df': result_df}
+                else:
+                    results = st.session_state.results = None
+            
+            # Results of the last run on this upload stay up across reruns
+            if results is not None and results['key'][1] == st.session_state.df_key:
+                sql_query, result_df = results['sql'], results['df']
+                
+                # Display generated SQL
+                st.subheader(" Generated SQL Query")
+                st.code(sql_query, language="sql")
+                
+                if result_df is not None:
+                    # Display results with enhanced styling
+                    st.subheader(" Query Results")
+                    
+                    # Add comprehensive key metrics at the top
+                    if len(result_df) > 0:
+                        numeric_cols, categorical_cols = split_columns(result_df)
                         
-                        # Enhanced data table with styling
-                        st.markdown("###  Detailed Results")
-                        st.dataframe(
-                            result_df, 
-                            use_container_width=True,
-                            height=300
-                        )
+                        # Dynamic metrics based on available columns
+                        metric_cols = st.columns(min(5, len(numeric_cols) + 2))
                         
-                        # Professional download section
-                        col1, col2 = st.columns([2, 1])
-                        with col1:
-                            csv = result_df.to_csv(index=False)
-                            st.download_button(
-                                label=" Export to Excel/CSV",
-                                data=csv,
-                                file_name=f"sql_genius_analysis_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.csv",
-                                mime="text/csv",
-                                help="Download your analysis results for further processing"
+                        # Always show record count
+                        with metric_cols[0]:
+                            st.metric(
+                                label=" Records Found", 
+                                value=f"{len(result_df):,}",
+                                delta=f"{len(result_df)} rows"
                             )
-                        with col2:
-                            st.info(" **Pro Tip**: Use exported data in Excel, PowerBI, or Tableau")
                         
-                        # Auto-generate comprehensive professional visualizations
-                        if len(result_df) > 0:
-                            st.markdown("---")
-                            st.subheader(" Business Intelligence Dashboards")
-                            
-                            charts = create_visualizations(result_df)
-                            
-                            if charts:
-                                # Create tabs for different chart types
-                                tab_names = [name for name, _ in charts]
-                                chart_tabs = st.tabs(tab_names)
-                                
-                                for i, (name, fig) in enumerate(charts):
-                                    with chart_tabs[i]:
-                                        st.plotly_chart(fig, use_container_width=True, config={
-                                            'displayModeBar': True,
-                                            'displaylogo': False,
-                                            'modeBarButtonsToRemove': ['pan2d', 'lasso2d']
-                                        })
-                                        
-                                        # Add business context for each chart
-                                        if "KPI" in name:
-                                            st.info(" **Insight**: Comprehensive performance overview with benchmarks and targets")
-                                        elif "Correlation" in name:
-                                            st.info(" **Insight**: Understand relationships between metrics for strategic planning")
-                                        elif "Efficiency" in name:
-                                            st.info(" **Insight**: ROI analysis showing performance vs investment patterns")
-                                        elif "Market Share" in name:
-                                            st.info(" **Insight**: Competitive positioning and market concentration analysis")
-                                        elif "Benchmarking" in name:
-                                            st.info(" **Insight**: Performance comparison against industry averages")
-                                        elif "ROI" in name:
-                                            st.info(" **Insight**: Financial efficiency and optimization opportunities")
-                                        elif "Ranking" in name:
-                                            st.info(" **Insight**: Top performer identification and tier analysis")
-                                        elif "Distribution" in name:
-                                            st.info(" **Insight**: Statistical analysis with quartiles and outlier detection")
-                            else:
-                                st.info(" **Visualization Note**: Upload more diverse data for advanced chart options")
+                        # Show metrics for each numeric column (both reductions in one pass)
+                        metric_numeric_cols = numeric_cols[:4]  # Up to 4 numeric metrics
+                        if metric_numeric_cols:
+                            metric_stats = result_df[metric_numeric_cols].agg(['sum', 'mean'])
+                        currency_cols = currency_columns(tuple(numeric_cols))
+                        metric_labels = {col: f" Total {col.replace('_', ' ').title()}" for col in metric_numeric_cols}
+                        metric_formats = {col: "${:,.0f}" if col in currency_cols else "{:,.0f}" for col in metric_numeric_cols}
+                        for i, col in enumerate(metric_numeric_cols):
+                            if i + 1 < len(metric_cols):
+                                with metric_cols[i + 1]:
+                                    st.metric(
+                                        label=metric_labels[col], 
+                                        value=metric_formats[col].format(metric_stats.at['sum', col]),
+                                        delta=f"Avg: {metric_stats.at['mean', col]:,.0f}"
+                                    )
                         
-                        # Enhanced AI explanation with business focus
+                        # Show categorical summary if space allows
+                        if len(categorical_cols) > 0 and len(metric_cols) > len(numeric_cols) + 1:
+                            with metric_cols[-1]:
+                                unique_count = result_df[categorical_cols[0]].nunique()
+                                st.metric(
+                                    label=f" Unique {categorical_cols[0].replace('_', ' ').title()}", 
+                                    value=f"{unique_count}",
+                                    delta="Segments"
+                                )
+                    
+                    # Enhanced data table with styling
+                    st.markdown("###  Detailed Results")
+                    st.dataframe(
+                        result_df.head(RESULT_DISPLAY_ROWS), 
+                        width="stretch",
+                        height=300
+                    )
+                    if len(result_df) > RESULT_DISPLAY_ROWS:
+                        st.caption(f"Showing {RESULT_DISPLAY_ROWS:,} of {len(result_df):,} rows - full data in CSV export")
+                    
+                    # Professional download section
+                    col1, col2 = st.columns([2, 1])
+                    with col1:
+                        csv = sql_to_csv(st.session_state.df_key, sql_query, result_df)
+                        st.download_button(
+                            label=" Export to Excel/CSV",
+                            data=csv,
+                            file_name=f"sql_genius_analysis_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.csv",
+                            mime="text/csv",
+                            help="Download your analysis results for further processing"
+                        )
+                    with col2:
+                        st.info(" **Pro Tip**: Use exported data in Excel, PowerBI, or Tableau")
+                    
+                    # Auto-generate comprehensive professional visualizations
+                    if len(result_df) > 0:
                         st.markdown("---")
+                        st.subheader(" Business Intelligence Dashboards")
                         
-                        # Create an impressive header for the business analysis
-                        st.markdown("""
-                        <div class="insight-box">
-                        <h2 style="color: white; margin: 0;"> AI Business Intelligence Report</h2>
-                        <p style="color: white; margin: 5px 0; font-size: 1.1rem;">Executive-Level Strategic Analysis</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        explanation = explain_results(result_df, sql_query)
-                        st.markdown(explanation)
+                        _, tab_names = sql_to_chart_plan(st.session_state.df_key, sql_query, result_df)
                         
-                        # Enhanced value proposition with styling
-                        st.markdown("""
-                        <div class="metric-card">
-                        <h3 style="color: #667eea; margin-top: 0;"> SQL Genius AI Business Value</h3>
-                        <p style="font-size: 1.1rem; margin: 10px 0;">
-                        <strong> Replaces $100K+ Data Analyst</strong><br>
-                         Instant executive-level insights<br>
-                         Strategic recommendations with ROI estimates<br>
-                         Professional-grade business intelligence<br>
-                         Zero setup time - immediate results
-                        </p>
-                        <p style="color: #764ba2; font-weight: bold; font-size: 1.2rem;">
-                         Typical customer saves 20-40 hours/month on data analysis
-                        </p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                    else:
-                        st.error(" Failed to execute SQL query. Please try a different approach or contact support.")
-                        
-                        # Helpful suggestions
-                        st.markdown("###  Troubleshooting Tips")
-                        st.markdown("- Try simpler queries like 'Show me all data' or 'Count the records'")
-                        st.markdown("- Check that column names in your query match the data preview")
-                        st.markdown("- Use the example buttons above for tested queries")
+                        if tab_names:
+                            # Create tabs for different chart types; only the open
+                            # tab's figure is built and sent (switching tabs reruns)
+                            chart_tabs = st.tabs(tab_names, on_change="rerun")
+                            
+                            for chart_tab, name in zip(chart_tabs, tab_names):
+                                if not chart_tab.open:
+                                    continue
+                                with chart_tab:
+                                    fig = sql_to_chart(st.session_state.df_key, sql_query, name, result_df)
+                                    if name in STATIC_CHARTS:
+                                        st.plotly_chart(fig, width="stretch", theme=None, config=STATIC_CHART_CONFIG)
+                                    else:
+                                        st.plotly_chart(fig, width="stretch", config=INTERACTIVE_CHART_CONFIG)
+                                    
+                                    # Add business context for each chart
+                                    insight = CHART_INSIGHTS.get(name)
+                                    if insight:
+                                        st.info(insight)
+                        else:
+                            st.info(" **Visualization Note**: Upload more diverse data for advanced chart options")
+                    
+                    # Enhanced AI explanation with business focus
+                    st.markdown("---")
+                    
+                    # Create an impressive header for the business analysis
+                    st.markdown(AI_REPORT_HEADER_HTML, unsafe_allow_html=True)
+                    
+                    explanation = sql_to_explanation(st.session_state.df_key, sql_query, result_df)
+                    st.markdown(explanation)
+                    
+                    # Enhanced value proposition with styling
+                    st.markdown(VALUE_PROP_HTML, unsafe_allow_html=True)
+                    
+                else:
+                    st.error(" Failed to execute SQL query. Please try a different approach or contact support.")
+                    
+                    # Helpful suggestions
+                    st.markdown("###  Troubleshooting Tips")
+                    st.markdown("- Try simpler queries like 'Show me all data' or 'Count the records'")
+                    st.markdown("- Check that column names in your query match the data preview")
+                    st.markdown("- Use the example buttons above for tested queries")
 
             elif query_input and not generate_button:
                 st.warning("Please click the 'Generate Executive Analysis' button to analyze your data.")
-            else:
+            elif not query_input:
                 st.warning("Please enter a description of what you want to analyze.")
     
     else:
-        # Landing page content
-        st.header(" How It Works")
-        
-        steps_col1, steps_col2, steps_col3 = st.columns(3)
-        
-        with steps_col1:
-            st.markdown("""
-            <div class="feature-box">
-            <h3>1.  Upload Data</h3>
-            <p>Drag & drop your CSV or Excel file. Your data stays completely private.</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with steps_col2:
-            st.markdown("""
-            <div class="feature-box">
-            <h3>2.  Ask Questions</h3>
-            <p>Describe what you want to know in plain English. No SQL knowledge required.</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with steps_col3:
-            st.markdown("""
-            <div class="feature-box">
-            <h3>3.  Get Insights</h3>
-            <p>See results, charts, and explanations instantly. Download everything.</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        # Call to action
-        st.markdown("---")
-        st.markdown("###  Upload your data file to get started!")
+        # Landing page content and call to action in a single element
+        st.markdown(LANDING_HTML, unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()